@@ -0,0 +1,2 @@
+# test_cursor.py, test_ocr.py and test_ocr_coords.py are manual macOS scripts (they take real screenshots), not pytest tests
+collect_ignore = ["test_cursor.py", "test_ocr.py", "test_ocr_coords.py"]
@@ -0,0 +1,323 @@
+"""Pure layout helpers for AIcceptor's OCR pipeline.
+
+Everything here works on plain {text, confidence, bbox} dicts, with bboxes in Vision's normalized,
+bottom-left-origin coordinates, so it can be exercised with synthetic OCR output on any platform.
+"""
+import os
+import re
+
+# Tiled OCR: tall (Retina/5K) frames are split into overlapping full-width bands OCR'd concurrently
+OCR_WORKERS = os.cpu_count() or 4
+OCR_TILE_MIN_HEIGHT = 480  # px; frames shorter than two bands are OCR'd in a single pass
+OCR_TILE_OVERLAP = 80      # px; taller than any UI text line, so every line is whole in at least one band
+# Two recognitions covering more than this fraction of the smaller box are the same text seen from two bands
+OCR_SEAM_OVERLAP = 0.5
+
+# Two-tier OCR: a cheap Fast pass finds candidate buttons, then Accurate runs only on small crops around them
+# Fast-level reads are sloppy ("Accep", "Alow"), so candidates are matched loosely and confirmed by the Accurate pass
+OCR_CANDIDATE_RE = re.compile(r"ac+e?p|al+ow", re.IGNORECASE)
+OCR_REFINE_PADDING = 24  # px; minimum padding around each candidate before the Accurate pass
+
+# Text-only escalation: how far around the prompt buttons we gather OCR lines (in screen points)
+CONTEXT_MAX_ABOVE = 400
+CONTEXT_MAX_WIDTH = 700
+# Below this confidence the extraction is not trusted and we fall back to the screenshot
+CONTEXT_MIN_CONFIDENCE = 0.4
+
+# Appended to TEXT_PROMPT: the OCR context the model judges instead of a screenshot. Everything between the
+# markers comes from the screen, so TEXT_PROMPT tells the model it is untrusted data, never instructions
+SCREEN_TEXT_BEGIN = "=== BEGIN UNTRUSTED SCREEN TEXT ==="
+SCREEN_TEXT_END = "=== END UNTRUSTED SCREEN TEXT ==="
+CONTEXT_TEMPLATE = """
+{begin}
+Prompt header: {header}
+Pending command: {command}
+File path: {file_path}
+Diff summary: {diff_summary}
+
+Detected buttons:
+{buttons}
+
+OCR text near the prompt (top to bottom):
+{lines}
+{end}
+"""
+
+URL_RE = re.compile(r"\b[a-z][\w+.-]*://\S+", re.IGNORECASE)
+# A command needs a shell prompt marker, or a known command word followed (within a few words) by a flag, URL or
+# path-like argument, so prose such as "make sure to run the tests" is not taken for a command
+COMMAND_PREFIX_RE = re.compile(r"^\s*(?:\$|❯)\s*(\S.*)$")
+COMMAND_WORD_RE = re.compile(
+    r"^\s*((?:sudo\s+)?(?:npm|npx|yarn|pnpm|pip3?|python3?|pytest|cargo|git|rm|mv|cp|mkdir|touch|curl|wget|"
+    r"chmod|chown|brew|make|node|go|docker|cd|ls|cat|echo|bash|sh)\s+(?:[\w:@.-]+\s+){0,3}"
+    r"(?:-{1,2}\w[\w-]*|[a-z][\w+.-]*://\S+|[\w.~@-]*[/=]\S*|[\w-]+\.\w+).*)$"
+)
+HEADER_RE = re.compile(
+    r"\b(?:run|execute|allow)\s+(?:this\s+|the\s+following\s+)?command\b|\brun\s+in\s+terminal\b",
+    re.IGNORECASE
+)
+# Paths are rooted (/, ~/, ./), have a file extension, or at least two separators, so "and/or" or "I/O" don't count
+PATH_RE = re.compile(
+    r"(?<!\w)(?:~|\.{1,2})?/(?:[\w.@-]+/)*[\w.@-]+"
+    r"|(?:[\w.@-]+/)+[\w.@-]*\.\w+"
+    r"|(?:[\w.@-]+/){2,}[\w.@-]+"
+    r"|\b[\w.-]+\.(?:py|js|ts|tsx|jsx|json|md|rs|go|java|c|cpp|h|css|html|yml|yaml|toml|sh|txt|env)\b"
+)
+DIFF_RE = re.compile(
+    r"\+\d+\s*[-−]\d+|\d+\s+files?\s+(?:changed|edited)|\d+\s+(?:insertions?|deletions?)\b[^,]*",
+    re.IGNORECASE
+)
+
+def compute_tiles(image_w, image_h, max_tiles=OCR_WORKERS, min_height=OCR_TILE_MIN_HEIGHT, overlap=OCR_TILE_OVERLAP):
+    """Splits an image into overlapping full-width horizontal bands. Returns (x, y, w, h) pixel rects, top-left origin.
+
+    Bands (rather than a grid) never cut a text line horizontally, so words are only ever split at the seams we overlap.
+    """
+    count = max(1, min(max_tiles, image_h // min_height))
+    if count == 1:
+        return [(0, 0, image_w, image_h)]
+    step = image_h / count
+    tiles = []
+    for i in range(count):
+        top = max(0, int(i * step) - overlap // 2)
+        bottom = min(image_h, int((i + 1) * step) + overlap // 2)
+        tiles.append((0, top, image_w, bottom - top))
+    return tiles
+
+def tile_to_image_bbox(bbox, tile, image_w, image_h):
+    """Maps a normalized Vision bbox (bottom-left origin) inside a tile back to normalized full-image coordinates."""
+    bx, by, bw, bh = bbox
+    tx, ty, tw, th = tile
+    # Vision's y axis starts at the bottom of the tile, while tile rects are measured from the top of the image
+    return (
+        (tx + bx * tw) / image_w,
+        (image_h - (ty + th) + by * th) / image_h,
+        bw * tw / image_w,
+        bh * th / image_h,
+    )
+
+def _boxes_overlap(a, b):
+    """True when two normalized bboxes overlap by more than OCR_SEAM_OVERLAP of the smaller one."""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    ix = min(ax + aw, bx + bw) - max(ax, bx)
+    iy = min(ay + ah, by + bh) - max(ay, by)
+    return ix > 0 and iy > 0 and ix * iy > OCR_SEAM_OVERLAP * min(aw * ah, bw * bh)
+
+def _boxes_touch(a, b):
+    """True when two normalized bboxes intersect at all."""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    return ax < bx + bw and bx < ax + aw and ay < by + bh and by < ay + ah
+
+def _merge_rank(obs):
+    """Larger boxes win a seam duplicate (they saw the whole line), then higher confidence."""
+    return (obs["bbox"][2] * obs["bbox"][3], obs["confidence"])
+
+def _seam_observations(observations, tile_index, seam, dropped):
+    """(index, observation) pairs of one tile that touch a seam rect and are still kept, sorted by left edge."""
+    return sorted(
+        ((k, obs) for k, obs in enumerate(observations)
+         if (tile_index, k) not in dropped and _boxes_touch(obs["bbox"], seam)),
+        key=lambda item: item[1]["bbox"][0],
+    )
+
+def merge_tile_observations(tile_results, tiles, image_w, image_h):
+    """Maps per-tile observations into full-image coordinates and drops duplicates from the overlapping seams.
+
+    Only observations from two different tiles that both touch the rows those tiles share are compared, so the merge
+    stays cheap on dense frames and never drops a box nested inside another from the same tile. When two
+    recognitions overlap, the larger box wins: it is the one that saw the whole line rather than a cut-off piece.
+    """
+    mapped = [
+        [dict(obs, bbox=tile_to_image_bbox(obs["bbox"], tile, image_w, image_h)) for obs in observations]
+        for observations, tile in zip(tile_results, tiles)
+    ]
+
+    dropped = set()  # (tile index, observation index)
+    for i, (ax, ay, aw, ah) in enumerate(tiles):
+        for j in range(i + 1, len(tiles)):
+            bx, by, bw, bh = tiles[j]
+            left, right = max(ax, bx), min(ax + aw, bx + bw)
+            top, bottom = max(ay, by), min(ay + ah, by + bh)
+            if left >= right or top >= bottom:
+                continue
+            # The shared rect in normalized, bottom-left-origin coordinates
+            seam = (left / image_w, 1.0 - bottom / image_h, (right - left) / image_w, (bottom - top) / image_h)
+
+            first = _seam_observations(mapped[i], i, seam, dropped)
+            second = _seam_observations(mapped[j], j, seam, dropped)
+            for k, obs in first:
+                x, _, w, _ = obs["bbox"]
+                for m, other in second:
+                    if other["bbox"][0] >= x + w:
+                        break  # sorted by x: nothing further right can overlap
+                    if (j, m) in dropped or not _boxes_overlap(obs["bbox"], other["bbox"]):
+                        continue
+                    if _merge_rank(obs) >= _merge_rank(other):
+                        dropped.add((j, m))
+                    else:
+                        dropped.add((i, k))
+                        break
+
+    merged = [
+        obs for tile_index, observations in enumerate(mapped)
+        for k, obs in enumerate(observations) if (tile_index, k) not in dropped
+    ]
+    # Restore reading order (top to bottom, left to right)
+    merged.sort(key=lambda o: (-(o["bbox"][1] + o["bbox"][3]), o["bbox"][0]))
+    return merged
+
+def is_button_text(text):
+    """UI buttons are short (e.g. "Accept", "Accept 2 Files", "Accept all"); source code lines containing "accept" are long."""
+    text = text.lower()
+    # Ignore the AIcceptor app's own text logs
+    return ("accept" in text or "allow" in text) and len(text) < 30 and "aicceptor" not in text
+
+def is_candidate_text(text):
+    """Loose version of is_button_text for Fast-level reads, which may truncate or misspell the label."""
+    return bool(OCR_CANDIDATE_RE.search(text)) and len(text) < 30 and "aicceptor" not in text.lower()
+
+def refine_regions(candidates, image_w, image_h, padding=OCR_REFINE_PADDING):
+    """Turns candidate observations (normalized, bottom-left origin) into padded pixel crops (x, y, w, h), top-left origin.
+
+    Padding scales with the line height; horizontally it is wider because a truncated Fast read ("Accep") has a box
+    narrower than the real label ("Accept all").
+    """
+    regions = []
+    for obs in candidates:
+        bx, by, bw, bh = obs["bbox"]
+        line_h = bh * image_h
+        pad_x = max(padding, 2 * line_h)
+        pad_y = max(padding, line_h)
+        left = max(0, int(bx * image_w - pad_x))
+        top = max(0, int((1.0 - by - bh) * image_h - pad_y))
+        right = min(image_w, int((bx + bw) * image_w + pad_x) + 1)
+        bottom = min(image_h, int((1.0 - by) * image_h + pad_y) + 1)
+        regions.append((left, top, right - left, bottom - top))
+    return regions
+
+def context_region(buttons, image_w, image_h, scale, padding=OCR_REFINE_PADDING):
+    """Full-width pixel crop (x, y, w, h), top-left origin, covering the rows extract_prompt_context reads above the buttons.
+
+    `buttons` are in screen points and `scale` is image pixels per screen point. The crop spans the full width so lines
+    are never cut; the column filtering is left to extract_prompt_context.
+    """
+    top = max(0, int((min(b["y"] for b in buttons) - CONTEXT_MAX_ABOVE) * scale - padding))
+    bottom = min(image_h, int(max(b["y"] for b in buttons) * scale + padding) + 1)
+    return (0, top, image_w, bottom - top)
+
+def extract_prompt_context(ocr_lines, buttons):
+    """Pulls the prompt header, pending command, file path and diff summary out of the OCR lines around the buttons.
+
+    `ocr_lines` are {text, x, y, w, h, confidence} dicts in screen coordinates. Lines are grouped into rows, then we
+    walk upwards from the buttons and stop at the first large vertical gap, which is where the prompt's text block
+    ends. Returns a dict with a 'confidence' in [0, 1].
+    """
+    context = {
+        "header": None, "command": None, "file_path": None, "diff_summary": None, "lines": [], "confidence": 0.0,
+    }
+    if not ocr_lines or not buttons:
+        return context
+
+    anchor_top = min(b["y"] for b in buttons)
+    anchor_bottom = max(b["y"] for b in buttons)
+    button_xs = [b["x"] for b in buttons]
+
+    # Only look at text in the same screen column as the prompt
+    nearby = [
+        l for l in ocr_lines
+        if anchor_top - CONTEXT_MAX_ABOVE <= l["y"] <= anchor_bottom + 5
+        and min(abs(l["x"] - bx) for bx in button_xs) <= CONTEXT_MAX_WIDTH
+        and "aicceptor" not in l["text"].lower()
+    ]
+    if not nearby:
+        return context
+
+    heights = sorted(l["h"] for l in nearby)
+    line_h = max(heights[len(heights) // 2], 1.0)
+
+    # Group lines sharing a baseline into rows, ordered top to bottom
+    rows = []
+    for l in sorted(nearby, key=lambda l: l["y"]):
+        if rows and abs(l["y"] - rows[-1][0]["y"]) <= line_h / 2.0:
+            rows[-1].append(l)
+        else:
+            rows.append([l])
+
+    # Walk upwards from the button rows until the text block ends
+    block = []
+    prev_y = None
+    for row in reversed(rows):
+        row_y = row[0]["y"]
+        if row_y >= anchor_top - line_h / 2.0:
+            block.append(row)
+            prev_y = row_y if prev_y is None else min(prev_y, row_y)
+            continue
+        if prev_y is not None and prev_y - row_y > max(3.0 * line_h, 40.0):
+            break
+        block.append(row)
+        prev_y = row_y
+    block.reverse()
+
+    # The detected buttons themselves are listed separately in the prompt
+    button_texts = {b["text"].lower() for b in buttons}
+    lines = []
+    for row in block:
+        words = [l["text"] for l in sorted(row, key=lambda l: l["x"] - l["w"] / 2.0) if l["text"].lower() not in button_texts]
+        row_text = " ".join(words).strip()
+        if row_text:
+            lines.append(row_text)
+    context["lines"] = lines
+
+    for text in lines:
+        if context["header"] is None:
+            match = HEADER_RE.search(text)
+            if match:
+                context["header"] = text
+        if context["command"] is None:
+            match = COMMAND_PREFIX_RE.match(text) or COMMAND_WORD_RE.match(text)
+            if match:
+                context["command"] = match.group(1).strip()
+        if context["file_path"] is None:
+            # A URL's host or route is not a file path
+            match = PATH_RE.search(URL_RE.sub(" ", text))
+            if match:
+                context["file_path"] = match.group(0)
+        if context["diff_summary"] is None:
+            match = DIFF_RE.search(text)
+            if match:
+                context["diff_summary"] = match.group(0).strip()
+
+    # Any single signal stays below CONTEXT_MIN_CONFIDENCE: a command, header, path or diff needs a second one with it
+    score = 0.0
+    if context["command"]:
+        score += 0.3
+    if context["header"]:
+        score += 0.3
+    if context["file_path"]:
+        score += 0.2
+    if context["diff_summary"]:
+        score += 0.3
+    block_lines = [l for row in block for l in row]
+    mean_conf = sum(l["confidence"] for l in block_lines) / len(block_lines)
+    context["confidence"] = min(1.0, score) * mean_conf
+    return context
+
+def _screen_text(text):
+    """Strips the delimiter markers from on-screen text so it cannot close the untrusted block early."""
+    return text.replace(SCREEN_TEXT_BEGIN, "").replace(SCREEN_TEXT_END, "")
+
+def build_text_prompt(prompt, context, buttons):
+    """Builds a text-only escalation request: `prompt` (instructions and rules) followed by the delimited OCR context."""
+    button_lines = "\n".join(f"- '{_screen_text(b['text'])}' at x={b['x']:.0f}, y={b['y']:.0f}" for b in buttons)
+    return prompt + CONTEXT_TEMPLATE.format(
+        begin=SCREEN_TEXT_BEGIN,
+        end=SCREEN_TEXT_END,
+        header=_screen_text(context["header"] or "(none found)"),
+        command=_screen_text(context["command"] or "(none found)"),
+        file_path=_screen_text(context["file_path"] or "(none found)"),
+        diff_summary=_screen_text(context["diff_summary"] or "(none found)"),
+        buttons=button_lines or "(none)",
+        lines=_screen_text("\n".join(context["lines"])) or "(none)",
+    )